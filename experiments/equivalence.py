@@ -1,15 +1,86 @@
 #!/usr/bin/env python3
 
+import re
 import sys
-from pysat.formula import CNF
+import argparse
+import numpy as np
+from multiprocessing import Pool
 from pysat.solvers import Solver
 
+# number of clauses sent to a worker process at once
+chunk_size = 64
+# default solver used for the implication checks (repeated solve calls under assumptions on the same formula)
+default_solver = "cadical153"
 
-def does_formula_imply(f1, f2):
-    with Solver(bootstrap_with=f1) as solver:
-        for clause in f2:
-            assumptions = [-l for l in clause]
-            sat = solver.solve(assumptions=assumptions)
+# comment and problem lines of DIMACS CNF
+non_clause_line_regex = re.compile(rb"^[cp].*$", re.MULTILINE)
+
+# solver owned by a worker process and the assumptions it checks, both set up once by _init_solver
+_solver: Solver = None
+_assumptions: list[tuple[int, ...]] = None
+
+
+def read_cnf(path: str) -> list[list[int]]:
+    with open(path, "rb") as file:
+        data = file.read()
+    # SATLIB benchmarks terminate the formula with a '%' line followed by a stray '0'
+    data = data.split(b"\n%", 1)[0]
+    data = non_clause_line_regex.sub(b"", data)
+    # parse all literals at once and split clauses at their terminating zeros; any token that isn't an integer
+    # raises (np.fromstring would stop at it and silently return only the literals before it on older numpy)
+    literals = np.array(data.split(), dtype=np.int32)
+    if len(literals) > 0 and literals[-1] != 0:
+        raise ValueError(f"Last clause of {path} isn't terminated by 0")
+    ends = np.flatnonzero(literals == 0)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    flat = literals.tolist()
+    return [flat[s:e] for s, e in zip(starts.tolist(), ends.tolist())]
+
+
+def remove_contained_clauses(f1, f2) -> list[list[int]]:
+    # clauses of f2 that also occur in f1 (as sets of literals) are implied trivially and need no solver call
+    f1_clauses = {frozenset(clause) for clause in f1}
+    return [clause for clause in f2 if frozenset(clause) not in f1_clauses]
+
+
+def _init_solver(solver_name: str, formula: list[list[int]], assumptions: list[tuple[int, ...]]):
+    global _solver, _assumptions
+    _solver = Solver(name=solver_name, bootstrap_with=formula)
+    _assumptions = assumptions
+
+
+def _check_clause(index: int) -> tuple[int, bool]:
+    sat = _solver.solve(assumptions=_assumptions[index])
+    return index, sat
+
+
+def does_formula_imply_parallel(f1, f2, assumptions, processes: int, solver_name: str):
+    # the formula and the assumptions are sent to each worker once, tasks and results are just clause indices
+    with Pool(processes=processes, initializer=_init_solver, initargs=(solver_name, list(f1), assumptions)) as pool:
+        for index, sat in pool.imap_unordered(_check_clause, range(len(f2)), chunksize=chunk_size):
+            if sat:
+                print(f"clause {f2[index]} is not implied by formula")
+                print(f1)
+                # leaving the context terminates the remaining workers
+                return False
+    return True
+
+
+def does_formula_imply(f1, f2, processes: int = 1, solver_name: str = default_solver):
+    # short clauses are checked first, they are the most likely ones not to be implied (e.g. units fixing
+    # auxiliary variables); the sort is stable so clauses of the same length keep their original order
+    f2 = sorted(remove_contained_clauses(f1, f2), key=len)
+    if not f2:
+        return True
+    # the negated clauses are built once, as tuples (cheaper to create and for pysat to convert than lists)
+    assumptions = [tuple(-l for l in clause) for clause in f2]
+    if processes > 1:
+        return does_formula_imply_parallel(f1, f2, assumptions, processes, solver_name)
+    with Solver(name=solver_name, bootstrap_with=f1) as solver:
+        for clause, clause_assumptions in zip(f2, assumptions):
+            # no separate propagate() call: solve() returns without search when propagating the assumptions
+            # already leads to a conflict, and propagate() additionally builds the list of propagated literals
+            sat = solver.solve(assumptions=clause_assumptions)
             if sat:
                 print(f"clause {clause} is not implied by formula")
                 print(f1)
@@ -17,15 +88,56 @@ def does_formula_imply(f1, f2):
     return True
 
 
-def compare_formulas_pysat(path1, path2):
-    cnf1 = CNF(from_file=path1)
-    cnf2 = CNF(from_file=path2)
-    f1_impl_f2 = does_formula_imply(cnf1, cnf2)
+def negate_formula_tseitin(formula, top_var: int) -> list[list[int]]:
+    # each non-unit clause c gets an auxiliary variable a_c with a_c -> not c; only this polarity is needed, the
+    # negation holds iff some a_c (or the negated literal of a unit clause) is true
+    clauses = []
+    falsified = []
+    for clause in formula:
+        if len(clause) == 1:
+            falsified.append(-clause[0])
+            continue
+        top_var += 1
+        falsified.append(top_var)
+        clauses.extend([-top_var, -l] for l in clause)
+    clauses.append(falsified)
+    return clauses
+
+
+def does_formula_imply_tseitin(f1, f2, solver_name: str = default_solver):
+    # single solver call: f1 implies f2 iff f1 and not f2 is unsatisfiable
+    f2 = remove_contained_clauses(f1, f2)
+    if not f2:
+        return True
+    top_var = max((abs(l) for f in (f1, f2) for clause in f for l in clause), default=0)
+    with Solver(name=solver_name, bootstrap_with=f1) as solver:
+        solver.append_formula(negate_formula_tseitin(f2, top_var))
+        if not solver.solve():
+            return True
+        model = solver.get_model()
+    satisfied = set(model)
+    clause = next(c for c in f2 if not any(l in satisfied for l in c))
+    print(f"clause {clause} is not implied by formula")
+    print(f1)
+    return False
+
+
+def compare_formulas_pysat(path1, path2, processes: int = 1, method: str = "clauses",
+                           solver_name: str = default_solver):
+    cnf1 = read_cnf(path1)
+    cnf2 = read_cnf(path2)
+
+    def implies(f1, f2):
+        if method == "tseitin":
+            return does_formula_imply_tseitin(f1, f2, solver_name)
+        return does_formula_imply(f1, f2, processes, solver_name)
+
+    f1_impl_f2 = implies(cnf1, cnf2)
     if f1_impl_f2:
         print("formula 1 implies formula 2")
     else:
         print("formula 1 does not imply formula 2")
-    f2_impl_f1 = does_formula_imply(cnf2, cnf1)
+    f2_impl_f1 = implies(cnf2, cnf1)
     if f2_impl_f1:
         print("formula 2 implies formula 1")
     else:
@@ -33,15 +145,24 @@ def compare_formulas_pysat(path1, path2):
     return f1_impl_f2 and f2_impl_f1
 
 
-if __name__ == '__main__':
-    if (len(sys.argv)) != 3:
-        print(f"usage: {sys.argv[0]} formula1 formula2", file=sys.stderr)
-        sys.exit(2)
+# CLI
+parser = argparse.ArgumentParser(description="Check whether two CNF formulas are equivalent",
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("formula1", type=str, help="Path to the first formula (DIMACS CNF)")
+parser.add_argument("formula2", type=str, help="Path to the second formula (DIMACS CNF)")
+parser.add_argument("-p", "--processes", type=int, default=1,
+                    help="Number of worker processes checking clauses concurrently")
+parser.add_argument("-m", "--method", type=str, choices=["clauses", "tseitin"], default="clauses",
+                    help="Check each clause of the implied formula with a separate solver call, or the whole "
+                         "implication with a single call on the Tseitin-encoded negation (ignores --processes)")
+parser.add_argument("-s", "--solver", type=str, default=default_solver,
+                    help="Name of the pysat solver used for the checks (e.g. glucose42, cadical153, minisat22)")
 
-    path1 = sys.argv[1]
-    path2 = sys.argv[2]
+if __name__ == '__main__':
+    args = parser.parse_args()
 
-    equivalent = compare_formulas_pysat(path1, path2)
+    equivalent = compare_formulas_pysat(args.formula1, args.formula2, args.processes, args.method,
+                                        args.solver)
 
     if equivalent:
         print("equivalent")
@@ -1,18 +1,33 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import os
+import mmap
 import sys
 import argparse
 import json
-import pandas as pd
-import matplotlib.pyplot as plt
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache, partial
 from pathlib import Path
-from typing import Callable, Generator
+from typing import TYPE_CHECKING, Any, Callable, Generator
 from run import run_dp_experiments
-from tables import create_tables
-from plots import create_plots
-from summary_table import extract_setup_summary_data, create_setup_summary_table
-from summary_plots import create_setup_summary_plots
+
+# numpy, pandas and matplotlib (and the modules using them) take most of the startup time, they are only imported
+# by the commands processing metrics; running experiments doesn't need them
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# plots are only used locally, fast zlib compression saves encoding time at the cost of somewhat larger files
+png_compress_level = 1
 
 # path constants
 script_root_dir: Path = Path(os.path.realpath(__file__)).parent.absolute()
@@ -20,9 +35,10 @@ input_formulas_list_path: Path = script_root_dir / "input_formulas.txt"
 default_config_path: Path = script_root_dir / "default_config.toml"
 inputs_dir: Path = script_root_dir / "inputs"
 setups_dir: Path = script_root_dir / "setups"
+tables_module_path: Path = script_root_dir / "tables.py"
+plots_module_path: Path = script_root_dir / "plots.py"
 
 # setups
-input_formulas: list[str] = None
 experiment_setups: list[str] = [
     "all_minimizations",
     "only_complete_minimization",
@@ -34,26 +50,26 @@ experiment_setups: list[str] = [
 ]
 
 
-def get_input_formulas() -> list[str]:
-    global input_formulas
-    if not input_formulas:
-        with open(input_formulas_list_path, "r") as file:
-            input_formulas = [line.rstrip() for line in file.readlines()]
-    return input_formulas
+@cache
+def get_input_formulas() -> tuple[str, ...]:
+    with open(input_formulas_list_path, "r") as file:
+        return tuple(line.rstrip() for line in file)
 
 
-def generate_setups(results_dir: Path) -> Generator[tuple[Path, Path, Path, Path], None, None]:
+def generate_setups(results_dir: Path) -> Generator[tuple[str, str, Path, Path, Path, Path], None, None]:
+    # paths depending only on the setup or only on the formula are built once, not for every combination
+    setups = [(setup, setups_dir / f"{setup}.toml", results_dir / setup) for setup in experiment_setups]
     for formula in get_input_formulas():
-        for setup in experiment_setups:
-            setup_config_path = setups_dir / f"{setup}.toml"
-            input_config_path = inputs_dir / f"{formula}.toml"
-            input_formula_path = inputs_dir / f"{formula}.cnf"
-            output_dir_path = results_dir / f"{setup}/{formula}"
+        input_config_path = inputs_dir / f"{formula}.toml"
+        input_formula_path = inputs_dir / f"{formula}.cnf"
+        for setup, setup_config_path, setup_results_dir in setups:
+            output_dir_path = setup_results_dir / formula
             yield setup, formula, setup_config_path, input_config_path, input_formula_path, output_dir_path
 
 
 def count_setups(args):
-    print(len(list(generate_setups(Path()))))
+    # generate_setups yields every combination of an input formula and a setup
+    print(len(get_input_formulas()) * len(experiment_setups))
 
 
 # execution
@@ -62,51 +78,183 @@ def run_experiments(args):
     results_dir = Path(args.results_dir)
     num_processes = args.processes
     setup_index = args.setup_index
-    run_dp_experiments(dp_path, results_dir, num_processes, setup_index)
+    force = args.force
+    pin_cpus = args.pin_cpus
+    run_dp_experiments(dp_path, results_dir, num_processes, setup_index, force, pin_cpus)
 
 
 # data processing template
-def process_metrics(results_dir_path: str, func: Callable[[Path, dict], None]):
+def is_up_to_date(path: Path, *source_paths: Path,
+                  get_mtime: Callable[[Path], float] = os.path.getmtime) -> bool:
+    # whether the file exists and isn't older than any of the files it was created from; get_mtime can memoize the
+    # modification times of sources shared by many files
+    try:
+        mtime = os.path.getmtime(path)
+    except FileNotFoundError:
+        return False
+    return all(mtime >= get_mtime(p) for p in source_paths)
+
+
+def is_metrics_file_complete(metrics_path: Path) -> bool:
+    # dp creates metrics.json before exporting into it, a run killed during the export leaves an empty or truncated
+    # file behind; a file that was already parsed into an up-to-date cache needn't be parsed again
+    if is_up_to_date(metrics_path.with_suffix(".pkl"), metrics_path):
+        return True
+    try:
+        data = metrics_path.read_bytes()
+    except FileNotFoundError:
+        return False
+    if len(data) == 0:
+        return False
+    try:
+        orjson.loads(data) if orjson else json.loads(data)
+    except ValueError:
+        return False
+    return True
+
+
+def read_cache(cache_path: Path) -> Any:
+    with open(cache_path, "rb") as file:
+        return pickle.load(file)
+
+
+def write_cache(cache_path: Path, value: Any):
+    # written to a temporary file first so that an interrupted write never leaves a truncated cache behind
+    tmp_cache_path = cache_path.with_suffix(".pkl.tmp")
+    with open(tmp_cache_path, "wb") as file:
+        pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_cache_path, cache_path)
+
+
+def load_metrics(metrics_path: Path) -> dict:
+    # parsed metrics are memoized in a pickle next to the JSON file and reused while it's up to date
+    cache_path = metrics_path.with_suffix(".pkl")
+    if is_up_to_date(cache_path, metrics_path):
+        return read_cache(cache_path)
+    with open(metrics_path, "rb") as file:
+        if orjson:
+            # orjson parses straight from the page cache through a memory map, the file isn't copied into memory first
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as data:
+                metrics: dict = orjson.loads(data)
+        else:
+            metrics = json.load(file)
+    import numpy as np
+
+    # series are converted to numpy arrays once here, all tables and plots process them as arrays; dp writes all
+    # series and durations as 64-bit integers, giving the type up front saves numpy inferring it from every value
+    for section in ("series", "durations"):
+        metrics[section] = {key: np.array(values, dtype=np.int64) for key, values in metrics[section].items()}
+    write_cache(cache_path, metrics)
+    return metrics
+
+
+def _process_metrics_file(func: Callable[[Path, dict, str, str], Any], task: tuple[Path, Path, str, str]) -> Any:
+    output_dir_path, metrics_path, setup, formula = task
+    print(f"Processing metrics file {metrics_path}", flush=True)
+    metrics = load_metrics(metrics_path)
+    return func(output_dir_path, metrics, setup, formula)
+
+
+def process_metrics(results_dir_path: str, func: Callable[[Path, dict, str, str], Any],
+                    num_processes: int = 1) -> list[tuple[str, str, Any]]:
     results_dir = Path(results_dir_path).absolute()
     if not results_dir.exists() or not results_dir.is_dir():
         print(f"Invalid path to results: {results_dir}", file=sys.stderr)
         sys.exit(1)
+    if num_processes < 1:
+        print(f"Invalid number of processes: {num_processes}", file=sys.stderr)
+        sys.exit(1)
+    tasks: list[tuple[Path, Path, str, str]] = []
     for setup, formula, _, _, _, output_dir_path in generate_setups(results_dir):
         metrics_path = output_dir_path / "metrics.json"
-        if metrics_path.exists() and metrics_path.is_file():
-            print(f"Processing metrics file {metrics_path}", flush=True)
-            with open(metrics_path, "r") as file:
-                metrics: dict = json.load(file)
-                func(output_dir_path, metrics, setup, formula)
+        if metrics_path.is_file():
+            tasks.append((output_dir_path, metrics_path, setup, formula))
         else:
             print(f"Metrics file {metrics_path} doesn't exist", file=sys.stderr, flush=True)
+    # experiments are processed independently, func must be picklable when running in parallel
+    process = partial(_process_metrics_file, func)
+    if num_processes == 1:
+        results = list(map(process, tasks))
+    else:
+        # tasks are sent in chunks (a few per worker), cached experiments take less time than the round trip
+        chunk_size = max(1, len(tasks) // (4 * num_processes))
+        with ProcessPoolExecutor(max_workers=num_processes) as exec:
+            results = list(exec.map(process, tasks, chunksize=chunk_size))
+    return [(setup, formula, result) for (_, _, setup, formula), result in zip(tasks, results)]
 
 
 # data processing
+def summarize_experiment(format: str, output_dir_path: Path, metrics: dict, *_):
+    from tables import create_tables
+
+    # created tables are memoized as well, so exporting them in another format doesn't compute them again; they
+    # depend only on the metrics and on the code creating them
+    cache_path = output_dir_path / "tables.pkl"
+    if is_up_to_date(cache_path, output_dir_path / "metrics.json", tables_module_path):
+        tables = read_cache(cache_path)
+    else:
+        tables = create_tables(metrics)
+        write_cache(cache_path, tables)
+    for name, table, include_index in tables:
+        export_table(table, output_dir_path / f"{name}.{format}", format, include_index)
+
+
 def summarize_metrics(args):
     results_dir = args.results_dir
     format = args.format
-    def process(output_dir_path: Path, metrics: dict, *_):
-        tables = create_tables(metrics)
-        for name, table, include_index in tables:
-            export_table(table, output_dir_path / f"{name}.{format}", format, include_index)
-    process_metrics(results_dir, process)
+    num_processes = args.processes
+    process_metrics(results_dir, partial(summarize_experiment, format), num_processes)
+
+
+def _format_text_row(cells: list[str], widths: list[int]) -> str:
+    return "| " + " | ".join(f"{c:^{w}}" for c, w in zip(cells, widths)) + " |"
+
+
+def _format_text_table(headers: np.ndarray, cells: np.ndarray) -> str:
+    import numpy as np
+
+    widths = np.maximum(np.char.str_len(cells).max(axis=0, initial=0), np.char.str_len(headers)).tolist()
+    rule = "+" + "+".join("-" * (w + 2) for w in widths) + "+"
+    lines = [rule, _format_text_row(headers.tolist(), widths), rule]
+    lines += [_format_text_row(row, widths) for row in cells.tolist()]
+    lines.append(rule)
+    return "\n".join(lines)
+
+
+def table_to_text(table: pd.DataFrame, include_index: bool, max_columns: int = 6) -> str:
+    import numpy as np
+
+    # same layout as tabulate's "pretty" format with centered string cells; tables with too many columns are split
+    # in halves printed below each other
+    headers = np.array([str(c) for c in table.columns], dtype=str)
+    # each column is stringified once according to its own dtype (as table.astype(str) would)
+    cells = np.column_stack([table.iloc[:, i].to_numpy().astype(str) for i in range(len(table.columns))])
+    if len(headers) > max_columns:
+        split = (len(headers) + 1) // 2
+        parts = [(headers[:split], cells[:, :split]), (headers[split:], cells[:, split:])]
+    else:
+        parts = [(headers, cells)]
+    if include_index:
+        index = table.index.astype(str).to_numpy(dtype=str)
+        parts = [(np.insert(h, 0, ""), np.column_stack([index, c])) for h, c in parts]
+    return "\n".join(_format_text_table(h, c) for h, c in parts)
 
 
 def export_table(table: pd.DataFrame, path: Path, format: str, include_index: bool):
     if format == "md":
-        if len(table.columns) > 6:
-            split = (len(table.columns) + 1) // 2
-            output = table.iloc[:, :split].astype(str).to_markdown(index=include_index, tablefmt="pretty") + "\n" + \
-                     table.iloc[:, split:].astype(str).to_markdown(index=include_index, tablefmt="pretty")
-        else:
-            output = table.astype(str).to_markdown(index=include_index, tablefmt="pretty")
+        output = table_to_text(table, include_index)
     elif format == "tex":
         output = table.to_latex(index=include_index)
     elif format == "csv":
-        output = table.to_csv(index=include_index)
+        # pandas' csv writer formats the rows in chunks and writes them to the file directly
+        table.to_csv(path, index=include_index)
+        return
     elif format == "json":
         output = table.to_json(index=include_index)
+    elif format == "parquet":
+        # binary columnar file for further processing by scripts (needs pyarrow), keeps the column dtypes
+        table.to_parquet(path, index=include_index, compression="zstd")
+        return
     else:
         raise NotImplementedError(f"Table format {format} not supported")
 
@@ -114,32 +262,69 @@ def export_table(table: pd.DataFrame, path: Path, format: str, include_index: bo
         file.write(output)
 
 
+def save_figure(fig: plt.Figure, path: Path, format: str, dpi: int):
+    # the backends of vector formats don't accept pil_kwargs at all
+    kwargs = {"pil_kwargs": {"compress_level": png_compress_level}} if format == "png" else {}
+    fig.savefig(path, format=format, dpi=dpi, **kwargs)
+
+
+# figure reused by all plots drawn in the current process
+_figure: plt.Figure = None
+
+
+def visualize_experiment(format: str, dpi: int, force: bool, output_dir_path: Path, metrics: dict, *_):
+    global _figure
+    from plots import create_plots, plot_functions
+    from matplotlib import pyplot as plt
+
+    # plots are only redrawn if the metrics or the plotting code changed since they were last saved; the marker is
+    # written after all plots and records the resolution they were saved with
+    marker_path = output_dir_path / f".plots.{format}"
+    settings = f"dpi={dpi}"
+    plot_paths = [output_dir_path / f"{name}.{format}" for name, _ in plot_functions]
+    if (not force and is_up_to_date(marker_path, output_dir_path / "metrics.json", plots_module_path)
+            and marker_path.read_text() == settings and all(p.exists() for p in plot_paths)):
+        return
+    if _figure is None:
+        _figure = plt.figure()
+    for path, (_, fig) in zip(plot_paths, create_plots(_figure, metrics)):
+        save_figure(fig, path, format, dpi)
+    marker_path.write_text(settings)
+
+
 def visualize_metrics(args):
     results_dir = args.results_dir
     format = args.format
     dpi = args.dpi
-    def process(output_dir_path: Path, metrics: dict, *_):
-        plots = create_plots(metrics)
-        for name, fig in plots:
-            fig.savefig(output_dir_path / f"{name}.{format}", format=format, dpi=dpi)
-            plt.close(fig)
-    process_metrics(results_dir, process)
+    num_processes = args.processes
+    force = args.force
+    process_metrics(results_dir, partial(visualize_experiment, format, dpi, force), num_processes)
+
+
+def summarize_experiment_setup(_, metrics: dict, *__) -> tuple[tuple, tuple]:
+    from summary_table import get_setup_summary_data
+
+    return get_setup_summary_data(metrics)
 
 
 def create_setups_summary(args):
+    from summary_table import create_setup_summary_table
+
     results_dir = args.results_dir
     results_dir_path = Path(results_dir).absolute()
     format = args.format
+    num_processes = args.processes
 
-    data = dict()
-    def process(_, metrics: dict, setup: str, formula: str):
-        extract_setup_summary_data(metrics, data, setup, formula)
-    process_metrics(results_dir, process)
-    table = create_setup_summary_table(data, experiment_setups)
+    records = process_metrics(results_dir, summarize_experiment_setup, num_processes)
+    table = create_setup_summary_table(records, experiment_setups)
     export_table(table, results_dir_path / f"summary_data.{format}", format, True)
 
 
 def visualize_setup_summaries(args):
+    import pandas as pd
+    from summary_plots import create_setup_summary_plots
+    from matplotlib import pyplot as plt
+
     data = args.data
     data_path = Path(data).absolute()
     output_dir = args.output_dir
@@ -151,11 +336,14 @@ def visualize_setup_summaries(args):
     if not legend:
         legend = experiment_setups
     setup_map = {s: l for s, l in zip(experiment_setups, legend)}
-    df = pd.read_csv(data_path, header=[0, 1], index_col=0)
-    plots = create_setup_summary_plots(df, setup_map)
-    for name, fig in plots:
-        fig.savefig(output_dir_path / f"{name}.{format}", format=format, dpi=dpi)
-        plt.close(fig)
+    if data_path.suffix == ".parquet":
+        df = pd.read_parquet(data_path)
+    else:
+        df = pd.read_csv(data_path, header=[0, 1], index_col=0)
+    fig = plt.figure()
+    for name, fig in create_setup_summary_plots(fig, df, setup_map):
+        save_figure(fig, output_dir_path / f"{name}.{format}", format, dpi)
+    plt.close(fig)
 
 
 # CLI
@@ -179,6 +367,10 @@ parser_run.add_argument("-i", "--setup-index",
                         type=int,
                         default=-1,
                         help="Run only one experimental setup at the given index")
+parser_run.add_argument("--force", action="store_true",
+                        help="Run also experiments whose metrics are newer than their input formula and configs")
+parser_run.add_argument("--pin-cpus", action="store_true",
+                        help="Pin each concurrently running experiment to its own group of CPUs (Linux only)")
 
 parser_summary = subparsers.add_parser("summarize",
                                        description="Process metrics from experiments and create summary tables",
@@ -187,7 +379,10 @@ parser_summary.set_defaults(func=summarize_metrics)
 parser_summary.add_argument("results_dir",
                             type=str,
                             help="Directory with results (given as '--results-dir' when running experiments)")
-parser_summary.add_argument("-f", "--format", type=str, default="md", help="Format of exported tables")
+parser_summary.add_argument("-f", "--format", type=str, default="md",
+                            help="Format of exported tables (md, tex, csv, json or parquet)")
+parser_summary.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1,
+                            help="Number of processes processing metrics concurrently")
 
 parser_visualize = subparsers.add_parser("visualize",
                                          description="Process metrics from experiments and visualize them",
@@ -198,6 +393,10 @@ parser_visualize.add_argument("results_dir",
                               help="Directory with results (given as '--results-dir' when running experiments)")
 parser_visualize.add_argument("-f", "--format", type=str, default="png", help="Format of plot files")
 parser_visualize.add_argument("-r", "--dpi", "--resolution", type=int, default=150, help="Resolution of plots")
+parser_visualize.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1,
+                              help="Number of processes processing metrics concurrently")
+parser_visualize.add_argument("--force", action="store_true",
+                              help="Redraw also plots that are newer than their metrics and the plotting code")
 
 parser_setup_summary = subparsers.add_parser("setup-summary",
                                              description="Process metrics from experiments and create summary table",
@@ -207,6 +406,8 @@ parser_setup_summary.add_argument("results_dir",
                               type=str,
                               help="Directory with results (given as '--results-dir' when running experiments)")
 parser_setup_summary.add_argument("-f", "--format", type=str, default="csv", help="Format of the table")
+parser_setup_summary.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1,
+                              help="Number of processes processing metrics concurrently")
 
 parser_visualize_setup_summary = subparsers.add_parser("visualize-setup-summary",
                                                        description="Process metrics from experiments and generate plots"
@@ -215,7 +416,7 @@ parser_visualize_setup_summary = subparsers.add_parser("visualize-setup-summary"
 parser_visualize_setup_summary.set_defaults(func=visualize_setup_summaries)
 parser_visualize_setup_summary.add_argument("data",
                                             type=str,
-                                            help="File containing summary data as a CSV")
+                                            help="File containing summary data as a CSV (or a parquet file)")
 parser_visualize_setup_summary.add_argument("-o", "--output-dir", type=str, default=".",
                                             help="Directory to save the plots to")
 parser_visualize_setup_summary.add_argument("-l", "--legend", type=str, nargs=len(experiment_setups), default=None,
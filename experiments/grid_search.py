@@ -7,10 +7,11 @@ import json
 import argparse
 import numpy as np
 import pandas as pd
+from functools import cache
 from typing import Generator
 from pathlib import Path
-from experiments import setups_dir, inputs_dir, default_config_path
-from run import run_experiment
+from experiments import setups_dir, inputs_dir
+from run import prepare_experiment, run_experiment, run_experiments_in_parallel
 
 
 # data extraction
@@ -69,38 +70,46 @@ def generate_setups(results_dir: Path) -> Generator[tuple[tuple[str, np.float64]
                 yield config, formula, setup_config_path, input_config_path, input_formula_path, output_dir_path, extra_options
 
 
-def run_grid_search(dp_path: Path, results_dir: Path, setup_index: int):
+def run_grid_search(dp_path: Path, results_dir: Path, setup_index: int, num_processes: int = 1, force: bool = False):
     if not dp_path.exists():
         print(f"Invalid path to dp executable: {dp_path}", file=sys.stderr)
         sys.exit(1)
+    if num_processes < 1:
+        print(f"Invalid number of processes: {num_processes}", file=sys.stderr)
+        sys.exit(1)
     # prepare execution setups
     commands: list[list[str]] = []
     working_dirs: list[Path] = []
+    num_skipped = 0
+    # formulas and configs are shared by many configurations, each of them is looked up only once
+    input_exists = cache(Path.exists)
+    input_mtime = cache(os.path.getmtime)
+    dp_executable = str(dp_path.absolute())
     for i, (_, _,
             setup_config_path,
             input_config_path,
             input_formula_path,
             output_dir_path,
-            extra_options) in enumerate(generate_setups(results_dir)):
+            extra_options) in enumerate(generate_setups(results_dir.absolute())):
         if setup_index >= 0 and i != setup_index:
             continue
-        command_with_args = [
-            str(dp_path.absolute()),
-            str(input_formula_path),
-            "--config", str(default_config_path),
-            "--config", str(setup_config_path),
-        ]
-        if input_config_path.exists():
-            command_with_args += ["--config", str(input_config_path)]
-        command_with_args += extra_options
-        os.makedirs(output_dir_path, exist_ok=True)
+        command_with_args = prepare_experiment(dp_executable, input_formula_path, setup_config_path,
+                                               input_config_path, output_dir_path, force, extra_options,
+                                               input_exists=input_exists, input_mtime=input_mtime)
+        if command_with_args is None:
+            num_skipped += 1
+            continue
         commands.append(command_with_args)
         working_dirs.append(output_dir_path)
-    # execute
-    in_parallel = [False for _ in range(len(commands))]
-    iter = map(run_experiment, commands, working_dirs, in_parallel)
-    for _ in iter:
-        pass
+    if num_skipped > 0:
+        print(f"Skipping {num_skipped} configurations with up-to-date metrics (use --force to run them again)")
+    # execute, configurations are independent of each other and can run in parallel
+    if num_processes == 1:
+        for command, dir in zip(commands, working_dirs):
+            run_experiment(command, dir, False)
+    else:
+        print(f"Running {len(commands)} configurations in parallel (max {num_processes} processes)\n")
+        run_experiments_in_parallel(commands, working_dirs, num_processes, results_dir)
 
 
 def extract_results(results_dir: Path):
@@ -126,7 +135,8 @@ def count_setups(args):
 
 
 def run_search(args):
-    run_grid_search(Path(args.dp_executable), Path(args.results_dir), args.setup_index)
+    run_grid_search(Path(args.dp_executable), Path(args.results_dir), args.setup_index, args.processes,
+                    args.force)
 
 
 def process_results(args):
@@ -152,6 +162,9 @@ parser_run.add_argument("-i", "--setup-index",
                         type=int,
                         default=-1,
                         help="Run only one experimental setup at the given index")
+parser_run.add_argument("-p", "--processes", type=int, default=1, help="Number of processes spawned concurrently")
+parser_run.add_argument("--force", action="store_true",
+                        help="Run also configurations whose metrics are newer than their input formula and configs")
 
 parser_process = subparsers.add_parser("process",
                                        description="Process results into a single table",
@@ -1,6 +1,13 @@
-import math
+import numpy as np
+import matplotlib
+from typing import Callable, Generator
+# plots are only saved to files, never shown
+matplotlib.use("Agg")
 from matplotlib import pyplot as plt, ticker
 
+# long series are rendered in chunks, Agg fails on paths with too many vertices otherwise
+plt.rcParams["agg.path.chunksize"] = 10000
+
 scaling_factor_units_map = {
     0: "us",
     1: "ms",
@@ -8,6 +15,9 @@ scaling_factor_units_map = {
     3: "10^3 s",
 }
 
+# lines with more than twice as many points are reduced to the extremes of this many bins before plotting
+line_bins = 2000
+
 
 def get_divider(factor: int):
     def divider(val: int, *args):
@@ -15,13 +25,36 @@ def get_divider(factor: int):
     return divider
 
 
+def decimate_line(values) -> tuple[np.ndarray, np.ndarray]:
+    values = np.asarray(values)
+    n = len(values)
+    if n <= 2 * line_bins:
+        return np.arange(n), values
+    # the minimum and maximum of each bin are kept (together with the first and last point), so that the line
+    # still reaches all of its peaks and spans the same range
+    bin_size = -(-n // line_bins)
+    full = n - n % bin_size
+    bins = values[:full].reshape(-1, bin_size)
+    offsets = np.arange(0, full, bin_size)
+    indices = [[0, n - 1], offsets + bins.argmin(axis=1), offsets + bins.argmax(axis=1)]
+    if full < n:
+        tail = values[full:]
+        indices.append([full + tail.argmin(), full + tail.argmax()])
+    indices = np.unique(np.concatenate(indices))
+    return indices, values[indices]
+
+
 def get_axes_scaling_factor(ax: plt.Axes) -> tuple[int, str]:
     min_value, max_value = ax.get_ylim()
     extreme = max(abs(min_value), abs(max_value))
     if extreme < 1000:
         exp = 0
     else:
-        exp = math.floor(math.log(extreme, 1000))
+        # largest exponent with 1000^exp <= extreme, compared with exact integer powers (a floating point logarithm
+        # may round down at exact powers of 1000)
+        exp = 1
+        while 1000 ** (exp + 1) <= extreme:
+            exp += 1
         if extreme / (1000 ** exp) < 4:
             exp -= 1
     factor = 1000 ** exp
@@ -29,15 +62,14 @@ def get_axes_scaling_factor(ax: plt.Axes) -> tuple[int, str]:
     return int(factor), unit
 
 
-def plot_zbdd_size(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
+def plot_zbdd_size(fig: plt.Figure, metrics: dict) -> list[plt.Axes]:
     axes = []
     series = metrics["series"]
 
-    sub: tuple[plt.Figure, plt.Axes] = plt.subplots()
-    fig, ax = sub
+    ax: plt.Axes = fig.subplots()
     axes.append(ax)
-    ax.plot(series["ClauseCounts"], "orange", label="clauses")
-    ax.plot(series["NodeCounts"], "red", label="nodes")
+    ax.plot(*decimate_line(series["ClauseCounts"]), "orange", label="clauses")
+    ax.plot(*decimate_line(series["NodeCounts"]), "red", label="nodes")
 
     ax.set_title("ZBDD size")
     ax.set_xlabel("# eliminated variables")
@@ -47,18 +79,17 @@ def plot_zbdd_size(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
     fig.legend(loc="lower left")
     fig.tight_layout()
     fig.subplots_adjust(bottom=0.2)
-    return fig, axes
+    return axes
 
 
-def plot_heuristic_accuracy(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
+def plot_heuristic_accuracy(fig: plt.Figure, metrics: dict) -> list[plt.Axes]:
     axes = []
     series = metrics["series"]
 
-    sub: tuple[plt.Figure, plt.Axes] = plt.subplots()
-    fig, ax = sub
+    ax: plt.Axes = fig.subplots()
     axes.append(ax)
-    ax.plot(series["HeuristicScores"], "blue", label="heuristic score")
-    ax.plot(series["ClauseCountDifference"], "orange", label="clause count difference")
+    ax.plot(*decimate_line(series["HeuristicScores"]), "blue", label="heuristic score")
+    ax.plot(*decimate_line(series["ClauseCountDifference"]), "orange", label="clause count difference")
 
     ax.set_title("Heuristic accuracy")
     ax.set_xlabel("# eliminated variables")
@@ -68,17 +99,16 @@ def plot_heuristic_accuracy(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
     fig.legend(loc="lower left", ncol=2)
     fig.tight_layout()
     fig.subplots_adjust(bottom=0.2)
-    return fig, axes
+    return axes
 
 
-def plot_unit_literals(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
+def plot_unit_literals(fig: plt.Figure, metrics: dict) -> list[plt.Axes]:
     axes = []
     series = metrics["series"]
 
-    sub: tuple[plt.Figure, plt.Axes] = plt.subplots()
-    fig, ax = sub
+    ax: plt.Axes = fig.subplots()
     axes.append(ax)
-    ax.plot(series["UnitLiteralsRemoved"], "red", label="unit literals")
+    ax.plot(*decimate_line(series["UnitLiteralsRemoved"]), "red", label="unit literals")
 
     ax.set_title("Unit literals removed")
     ax.set_xlabel("# eliminated variables")
@@ -89,31 +119,31 @@ def plot_unit_literals(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
     fig.legend(loc="lower left")
     fig.tight_layout()
     fig.subplots_adjust(bottom=0.15)
-    return fig, axes
+    return axes
 
 
-def plot_absorbed_clauses(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
+def plot_absorbed_clauses(fig: plt.Figure, metrics: dict) -> list[plt.Axes]:
     axes = []
     absorbed_removed = metrics["series"]["AbsorbedClausesRemoved"]
     durations = metrics["durations"]
 
-    sub: tuple[plt.Figure, plt.Axes] = plt.subplots()
-    fig, ax = sub
+    ax: plt.Axes = fig.subplots()
     axes.append(ax)
-    xticklabels = range(len(absorbed_removed))
+    positions = np.arange(len(absorbed_removed))
     ax.set_title("Removed absorbed clauses")
     ax.set_xlabel("# invocations")
     ax.set_ylabel("# absorbed clauses removed")
-    ax.bar(xticklabels, absorbed_removed, color="coral", width=0.4, label="removed clauses")
+    ax.bar(positions, absorbed_removed, color="coral", width=0.4, label="removed clauses")
     ax.set_ylim(bottom=0)
 
     ax: plt.Axes = ax.twinx()
     axes.append(ax)
-    ax.plot(durations["RemoveAbsorbedClauses_Search"], "green", label="search")
+    ax.plot(*decimate_line(durations["RemoveAbsorbedClauses_Search"]), "green", label="search")
     if len(durations["RemoveAbsorbedClauses_Serialize"]) > 0:
-        assert len(durations["RemoveAbsorbedClauses_Build"]) > 0
-        ax.plot(durations["RemoveAbsorbedClauses_Serialize"], "blue", label="serialize")
-        ax.plot(durations["RemoveAbsorbedClauses_Build"], "cyan", label="build")
+        if len(durations["RemoveAbsorbedClauses_Build"]) == 0:
+            raise ValueError("RemoveAbsorbedClauses has serialize but no build durations")
+        ax.plot(*decimate_line(durations["RemoveAbsorbedClauses_Serialize"]), "blue", label="serialize")
+        ax.plot(*decimate_line(durations["RemoveAbsorbedClauses_Build"]), "cyan", label="build")
     factor, unit = get_axes_scaling_factor(ax)
 
     ax.set_ylabel(f"duration ({unit})")
@@ -123,31 +153,31 @@ def plot_absorbed_clauses(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
     fig.legend(loc="lower left", ncol=2)
     fig.tight_layout()
     fig.subplots_adjust(bottom=0.2)
-    return fig, axes
+    return axes
 
 
-def plot_incremental_absorbed(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
+def plot_incremental_absorbed(fig: plt.Figure, metrics: dict) -> list[plt.Axes]:
     axes = []
     absorbed_not_added = metrics["series"]["AbsorbedClausesNotAdded"]
     durations = metrics["durations"]
 
-    sub: tuple[plt.Figure, plt.Axes] = plt.subplots()
-    fig, ax = sub
+    ax: plt.Axes = fig.subplots()
     axes.append(ax)
-    xticklabels = range(len(absorbed_not_added))
+    positions = np.arange(len(absorbed_not_added))
     ax.set_title("Incremental absorbed clause removal")
     ax.set_xlabel("# invocations")
     ax.set_ylabel("# absorbed clauses not added")
-    ax.bar(xticklabels, absorbed_not_added, color="coral", width=0.4, label="absorbed clauses")
+    ax.bar(positions, absorbed_not_added, color="coral", width=0.4, label="absorbed clauses")
     ax.set_ylim(bottom=0)
 
     ax: plt.Axes = ax.twinx()
     axes.append(ax)
-    ax.plot(durations["IncrementalAbsorbedRemoval_Search"], "green", label="search")
+    ax.plot(*decimate_line(durations["IncrementalAbsorbedRemoval_Search"]), "green", label="search")
     if len(durations["IncrementalAbsorbedRemoval_Serialize"]) > 0:
-        assert len(durations["IncrementalAbsorbedRemoval_Build"]) > 0
-        ax.plot(durations["IncrementalAbsorbedRemoval_Serialize"], "blue", label="serialize")
-        ax.plot(durations["IncrementalAbsorbedRemoval_Build"], "cyan", label="build")
+        if len(durations["IncrementalAbsorbedRemoval_Build"]) == 0:
+            raise ValueError("IncrementalAbsorbedRemoval has serialize but no build durations")
+        ax.plot(*decimate_line(durations["IncrementalAbsorbedRemoval_Serialize"]), "blue", label="serialize")
+        ax.plot(*decimate_line(durations["IncrementalAbsorbedRemoval_Build"]), "cyan", label="build")
     factor, unit = get_axes_scaling_factor(ax)
 
     ax.set_ylabel(f"duration ({unit})")
@@ -157,21 +187,20 @@ def plot_incremental_absorbed(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]
     fig.legend(loc="lower left", ncol=2)
     fig.tight_layout()
     fig.subplots_adjust(bottom=0.2)
-    return fig, axes
+    return axes
 
 
-def plot_elimination_duration(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
+def plot_elimination_duration(fig: plt.Figure, metrics: dict) -> list[plt.Axes]:
     axes = []
     durations = metrics["durations"]
 
-    sub: tuple[plt.Figure, plt.Axes] = plt.subplots()
-    fig, ax = sub
+    ax: plt.Axes = fig.subplots()
     axes.append(ax)
-    ax.plot(durations["EliminateVar_SubsetDecomposition"], "orange", label="subset decomposition")
-    ax.plot(durations["EliminateVar_Resolution"], "brown", label="resolution")
-    ax.plot(durations["EliminateVar_TautologiesRemoval"], "royalblue", label="tautologies removal")
-    ax.plot(durations["EliminateVar_Unification"], "green", label="unification")
-    ax.plot(durations["EliminateVar_Total"], "red", label="total")
+    ax.plot(*decimate_line(durations["EliminateVar_SubsetDecomposition"]), "orange", label="subset decomposition")
+    ax.plot(*decimate_line(durations["EliminateVar_Resolution"]), "brown", label="resolution")
+    ax.plot(*decimate_line(durations["EliminateVar_TautologiesRemoval"]), "royalblue", label="tautologies removal")
+    ax.plot(*decimate_line(durations["EliminateVar_Unification"]), "green", label="unification")
+    ax.plot(*decimate_line(durations["EliminateVar_Total"]), "red", label="total")
     factor, unit = get_axes_scaling_factor(ax)
 
     ax.set_title("Duration of variable elimination")
@@ -183,17 +212,16 @@ def plot_elimination_duration(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]
     fig.legend(loc="lower left", ncol=2)
     fig.tight_layout()
     fig.subplots_adjust(bottom=0.25)
-    return fig, axes
+    return axes
 
 
-def plot_read_duration(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
+def plot_read_duration(fig: plt.Figure, metrics: dict) -> list[plt.Axes]:
     axes = []
     durations = metrics["durations"]
 
-    sub: tuple[plt.Figure, plt.Axes] = plt.subplots()
-    fig, ax = sub
+    ax: plt.Axes = fig.subplots()
     axes.append(ax)
-    ax.plot(durations["ReadFormula_AddClause"], "green", label="clause addition")
+    ax.plot(*decimate_line(durations["ReadFormula_AddClause"]), "green", label="clause addition")
     factor, unit = get_axes_scaling_factor(ax)
 
     ax.set_title("Duration of reading input clause")
@@ -205,17 +233,16 @@ def plot_read_duration(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
     fig.legend(loc="lower left")
     fig.tight_layout()
     fig.subplots_adjust(bottom=0.15)
-    return fig, axes
+    return axes
 
 
-def plot_write_duration(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
+def plot_write_duration(fig: plt.Figure, metrics: dict) -> list[plt.Axes]:
     axes = []
     durations = metrics["durations"]
 
-    sub: tuple[plt.Figure, plt.Axes] = plt.subplots()
-    fig, ax = sub
+    ax: plt.Axes = fig.subplots()
     axes.append(ax)
-    ax.plot(durations["WriteFormula_PrintClause"], "orange", label="clause writing")
+    ax.plot(*decimate_line(durations["WriteFormula_PrintClause"]), "orange", label="clause writing")
     factor, unit = get_axes_scaling_factor(ax)
 
     ax.set_title("Duration of writing output clause")
@@ -227,34 +254,26 @@ def plot_write_duration(metrics: dict) -> tuple[plt.Figure, list[plt.Axes]]:
     fig.legend(loc="lower left")
     fig.tight_layout()
     fig.subplots_adjust(bottom=0.15)
-    return fig, axes
-
-
-def create_plots(metrics: dict) -> list[tuple[str, plt.Figure]]:
-    figures = []
-
-    fig_zbdd_size, _ = plot_zbdd_size(metrics)
-    figures.append(("zbdd_size", fig_zbdd_size))
-
-    fig_eliminated, _ = plot_heuristic_accuracy(metrics)
-    figures.append(("heuristic", fig_eliminated))
-
-    fig_unit_literals, _ = plot_unit_literals(metrics)
-    figures.append(("unit_literals", fig_unit_literals))
-
-    fig_absorbed, _ = plot_absorbed_clauses(metrics)
-    figures.append(("absorbed", fig_absorbed))
+    return axes
 
-    fig_incremental_absorbed, _ = plot_incremental_absorbed(metrics)
-    figures.append(("incremental_absorbed", fig_incremental_absorbed))
 
-    fig_elimination_duration, _ = plot_elimination_duration(metrics)
-    figures.append(("duration_elimination", fig_elimination_duration))
+plot_functions: list[tuple[str, Callable[[plt.Figure, dict], list[plt.Axes]]]] = [
+    ("zbdd_size", plot_zbdd_size),
+    ("heuristic", plot_heuristic_accuracy),
+    ("unit_literals", plot_unit_literals),
+    ("absorbed", plot_absorbed_clauses),
+    ("incremental_absorbed", plot_incremental_absorbed),
+    ("duration_elimination", plot_elimination_duration),
+    ("duration_read", plot_read_duration),
+    ("duration_write", plot_write_duration),
+]
 
-    fig_read_duration, _ = plot_read_duration(metrics)
-    figures.append(("duration_read", fig_read_duration))
 
-    fig_write_duration, _ = plot_write_duration(metrics)
-    figures.append(("duration_write", fig_write_duration))
+def create_plots(fig: plt.Figure, metrics: dict) -> Generator[tuple[str, plt.Figure], None, None]:
+    # all plots are drawn one by one into the same figure, which is cleared before each of them; each plot has to be
+    # saved before the next one is requested
+    for name, plot in plot_functions:
+        fig.clear()
+        plot(fig, metrics)
+        yield name, fig
 
-    return figures
@@ -2,59 +2,150 @@ import os
 import sys
 import subprocess
 import time
-from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from functools import cache
 from pathlib import Path
+from typing import Callable, Optional, Sequence
 
 
-def run_experiment(command: list[str], cwd: Path, is_run_in_parallel: bool = True) -> int:
+def start_experiment(command: list[str], cwd: Path, is_run_in_parallel: bool = True,
+                     cpus: Optional[set[int]] = None) -> tuple[subprocess.Popen, int, float]:
     if is_run_in_parallel:
-        out_file = open(cwd / "out.txt", "w")
-        err_file = out_file
+        out_fd = os.open(cwd / "out.txt", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        err_fd = out_fd
     else:
-        out_file = sys.stdout
-        err_file = sys.stderr
+        sys.stdout.flush()
+        sys.stderr.flush()
+        out_fd = sys.stdout.fileno()
+        err_fd = sys.stderr.fileno()
 
-    def print_out(*args, **kwargs):
-        print(*args, **kwargs, file=out_file)
+    # the header and the footer are written with a single call each, straight to the file descriptor the child
+    # writes to as well (no Python-side buffering to flush in between)
+    os.write(out_fd, f"{' '.join(command)}\n\noutput:\n".encode())
 
-    def print_err(*args, **kwargs):
-        print(*args, **kwargs, file=err_file)
+    start_time = time.monotonic()
+    # the child (and all threads of the experiment) inherits the affinity this process has when spawning it; it's set
+    # here only for the spawn instead of in a preexec_fn, which would force Popen from vfork to a full fork
+    if cpus:
+        parent_cpus = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, cpus)
+    try:
+        process = subprocess.Popen(command, cwd=cwd, stdout=out_fd, stderr=err_fd)
+    finally:
+        if cpus:
+            os.sched_setaffinity(0, parent_cpus)
+    return process, out_fd, start_time
 
-    print_out(" ".join(command))
-    print_out()
-    print_out("output:", flush=True)
 
-    start_time = time.monotonic()
-    result: subprocess.CompletedProcess[str] = subprocess.run(command, cwd=cwd, stdout=out_file, stderr=err_file)
+def finish_experiment(process: subprocess.Popen, out_fd: int, start_time: float) -> int:
+    # the process must have exited already (waited for or reaped)
     end_time = time.monotonic()
     duration = timedelta(seconds=end_time - start_time)
 
-    print_out()
-    print_out(f"Command exited with code {result.returncode}")
-
     block = "=" * 10
-    if result.returncode == 0:
+    if process.returncode == 0:
         result_msg = "Experiment finished"
     else:
         result_msg = "Experiment failed"
-    print_out(f"{block} {result_msg}, runtime {duration} {block}", flush=True)
+    os.write(out_fd, f"\nCommand exited with code {process.returncode}\n"
+                     f"{block} {result_msg}, runtime {duration} {block}\n".encode())
 
-    if out_file is not sys.stdout:
-        out_file.flush()
-        out_file.close()
-    return result.returncode
+    if out_fd != sys.stdout.fileno():
+        os.close(out_fd)
+    return process.returncode
 
 
-def run_dp_experiments(dp_path: Path, results_dir: Path, num_processes: int, setup_index: int):
-    from experiments import generate_setups, default_config_path
+def run_experiment(command: list[str], cwd: Path, is_run_in_parallel: bool = True) -> int:
+    process, out_fd, start_time = start_experiment(command, cwd, is_run_in_parallel)
+    process.wait()
+    return finish_experiment(process, out_fd, start_time)
+
+
+def get_cpu_groups(num_groups: int) -> list[set[int]]:
+    # the CPUs available to this process are split into contiguous groups of (nearly) the same size; if there are
+    # fewer CPUs than groups, some groups share a CPU
+    cpus = sorted(os.sched_getaffinity(0))
+    if num_groups >= len(cpus):
+        return [{cpus[i % len(cpus)]} for i in range(num_groups)]
+    return [set(cpus[i * len(cpus) // num_groups:(i + 1) * len(cpus) // num_groups]) for i in range(num_groups)]
+
+
+def run_experiments_in_parallel(commands: list[list[str]], working_dirs: list[Path], num_processes: int,
+                                results_dir: Path, pin_cpus: bool = False):
+    # the experiments are started directly from this thread, at most num_processes at a time; whichever child
+    # exits first is reaped with os.wait and the next experiment takes its place (and its slot, which determines the
+    # CPUs an experiment is pinned to, so that concurrent experiments don't compete for the same cores)
+    # there are never more slots than experiments, a few pinned experiments still split all the CPUs among them
+    num_slots = min(num_processes, len(commands))
+    cpu_groups = get_cpu_groups(num_slots) if pin_cpus else [None] * num_slots
+    free_slots = list(reversed(range(num_slots)))
+    pending = list(zip(commands, working_dirs))
+    pending.reverse()
+    running: dict[int, tuple[subprocess.Popen, int, float, Path, int]] = dict()
+    done = 0
+    while pending or running:
+        while pending and free_slots:
+            command, dir = pending.pop()
+            slot = free_slots.pop()
+            process, out_fd, start_time = start_experiment(command, dir, cpus=cpu_groups[slot])
+            running[process.pid] = (process, out_fd, start_time, dir, slot)
+        pid, status = os.wait()
+        if pid not in running:
+            continue
+        process, out_fd, start_time, dir, slot = running.pop(pid)
+        free_slots.append(slot)
+        # the child is already reaped, its Popen object only needs to know the exit code
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return_code = finish_experiment(process, out_fd, start_time)
+        done += 1
+        # the output of parallel runs is in their out.txt, only the result is reported here
+        experiment = dir.relative_to(results_dir.absolute())
+        print(f"[{done}/{len(commands)}] Experiment {experiment} exited with code {return_code}", flush=True)
+
+
+def prepare_experiment(dp_executable: str, input_formula_path: Path, setup_config_path: Path,
+                       input_config_path: Path, output_dir_path: Path, force: bool = False,
+                       extra_options: Sequence[str] = (), input_exists: Callable[[Path], bool] = Path.exists,
+                       input_mtime: Callable[[Path], float] = os.path.getmtime) -> Optional[list[str]]:
+    # the command running a single experiment (with the default config, the config of its setup and the config of its
+    # input if there is one), or None if the experiment is skipped; it's skipped if it already finished after its
+    # inputs were last modified (and wasn't killed while exporting its metrics), so that interrupted runs can be
+    # resumed
+    from experiments import default_config_path, is_up_to_date, is_metrics_file_complete
+
+    config_paths = [default_config_path, setup_config_path]
+    if input_exists(input_config_path):
+        config_paths.append(input_config_path)
+    metrics_path = output_dir_path / "metrics.json"
+    if (not force and is_up_to_date(metrics_path, input_formula_path, *config_paths, get_mtime=input_mtime)
+            and is_metrics_file_complete(metrics_path)):
+        return None
+    command_with_args = [dp_executable, str(input_formula_path)]
+    for config_path in config_paths:
+        command_with_args += ["--config", str(config_path)]
+    command_with_args += extra_options
+    os.makedirs(output_dir_path, exist_ok=True)
+    return command_with_args
+
+
+def run_dp_experiments(dp_path: Path, results_dir: Path, num_processes: int, setup_index: int, force: bool = False,
+                       pin_cpus: bool = False):
+    from experiments import generate_setups
 
     if not dp_path.exists():
         print(f"Invalid path to dp executable: {dp_path}", file=sys.stderr)
         sys.exit(1)
+    if num_processes < 1:
+        print(f"Invalid number of processes: {num_processes}", file=sys.stderr)
+        sys.exit(1)
     # prepare execution setups
     commands: list[list[str]] = []
     working_dirs: list[Path] = []
+    num_skipped = 0
+    # formulas and configs are shared by many experiments, each of them is looked up only once
+    input_exists = cache(Path.exists)
+    input_mtime = cache(os.path.getmtime)
+    dp_executable = str(dp_path.absolute())
     for i, (_, _,
             setup_config_path,
             input_config_path,
@@ -62,29 +153,21 @@ def run_dp_experiments(dp_path: Path, results_dir: Path, num_processes: int, set
             output_dir_path) in enumerate(generate_setups(results_dir.absolute())):
         if setup_index >= 0 and i != setup_index:
             continue
-        command_with_args = [str(dp_path.absolute()),
-                             str(input_formula_path),
-                             "--config", str(default_config_path),
-                             "--config", str(setup_config_path),
-        ]
-        if input_config_path.exists():
-            command_with_args += ["--config", str(input_config_path)]
-        os.makedirs(output_dir_path, exist_ok=True)
+        command_with_args = prepare_experiment(dp_executable, input_formula_path, setup_config_path,
+                                               input_config_path, output_dir_path, force,
+                                               input_exists=input_exists, input_mtime=input_mtime)
+        if command_with_args is None:
+            num_skipped += 1
+            continue
         commands.append(command_with_args)
         working_dirs.append(output_dir_path)
+    if num_skipped > 0:
+        print(f"Skipping {num_skipped} experiments with up-to-date metrics (use --force to run them again)")
     # execute in parallel
     if num_processes == 1:
-        in_parallel = [False for _ in range(len(commands))]
         print(f"Running {len(commands)} experiments serially\n")
+        for command, dir in zip(commands, working_dirs):
+            run_experiment(command, dir, False)
     else:
-        assert num_processes > 1
-        assert len(commands) > num_processes
-        in_parallel = [True for _ in range(len(commands))]
         print(f"Running {len(commands)} experiments in parallel (max {num_processes} processes)\n")
-    with ThreadPoolExecutor(max_workers=num_processes) as exec:
-        exit_codes = exec.map(run_experiment, commands, working_dirs, in_parallel)
-    # print results summary
-    if num_processes > 1:
-        print()
-        for dir, code in zip(working_dirs, exit_codes):
-            print(f"Experiment {dir.name} exited with code {code}")
+        run_experiments_in_parallel(commands, working_dirs, num_processes, results_dir, pin_cpus)
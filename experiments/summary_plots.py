@@ -1,3 +1,4 @@
+from typing import Generator
 import pandas as pd
 from matplotlib import pyplot as plt, ticker
 from plots import get_axes_scaling_factor, get_divider
@@ -49,11 +50,10 @@ def _plot_bar_group(ax: plt.Axes, data: list[tuple[list, str]]):
         ax.bar(pos, points, w, label=label)
 
 
-def plot_durations(labels: list, data: dict[str, list]) -> tuple[plt.Figure, list[plt.Axes]]:
+def plot_durations(fig: plt.Figure, labels: list, data: dict[str, list]) -> list[plt.Axes]:
     axes = []
 
-    sub: tuple[plt.Figure, plt.Axes] = plt.subplots()
-    fig, ax = sub
+    ax: plt.Axes = fig.subplots()
     axes.append(ax)
     _plot_bar_group(ax, [(points, setup) for setup, points in data.items()])
     factor, unit = get_axes_scaling_factor(ax)
@@ -69,14 +69,13 @@ def plot_durations(labels: list, data: dict[str, list]) -> tuple[plt.Figure, lis
     fig.set_size_inches(figure_width, figure_height)
     fig.legend(loc="lower left")
     fig.tight_layout()
-    return fig, axes
+    return axes
 
 
-def plot_vars(labels: list, data: dict[str, list]) -> tuple[plt.Figure, list[plt.Axes]]:
+def plot_vars(fig: plt.Figure, labels: list, data: dict[str, list]) -> list[plt.Axes]:
     axes = []
 
-    sub: tuple[plt.Figure, plt.Axes] = plt.subplots()
-    fig, ax = sub
+    ax: plt.Axes = fig.subplots()
     axes.append(ax)
     _plot_bar_group(ax, [(points, setup) for setup, points in data.items()])
 
@@ -90,14 +89,13 @@ def plot_vars(labels: list, data: dict[str, list]) -> tuple[plt.Figure, list[plt
     fig.set_size_inches(figure_width, figure_height)
     fig.legend(loc="lower left")
     fig.tight_layout()
-    return fig, axes
+    return axes
 
 
-def plot_growth(labels: list, data: dict[str, list]) -> tuple[plt.Figure, list[plt.Axes]]:
+def plot_growth(fig: plt.Figure, labels: list, data: dict[str, list]) -> list[plt.Axes]:
     axes = []
 
-    sub: tuple[plt.Figure, plt.Axes] = plt.subplots()
-    fig, ax = sub
+    ax: plt.Axes = fig.subplots()
     axes.append(ax)
     _plot_bar_group(ax, [(points, setup) for setup, points in data.items()])
 
@@ -112,21 +110,20 @@ def plot_growth(labels: list, data: dict[str, list]) -> tuple[plt.Figure, list[p
     fig.set_size_inches(figure_width, figure_height)
     fig.legend(loc="lower left")
     fig.tight_layout()
-    return fig, axes
+    return axes
 
 
 # interface
-def create_setup_summary_plots(df: pd.DataFrame, setups: dict[str, str]) -> list[tuple[str, plt.Figure]]:
+def create_setup_summary_plots(fig: plt.Figure, df: pd.DataFrame,
+                               setups: dict[str, str]) -> Generator[tuple[str, plt.Figure], None, None]:
+    # same as create_plots, the plots are drawn one by one into the same (cleared) figure
     labels = [i.rsplit('/', 1)[1] for i in df.index]
-    figures = []
-
-    fig_duration, _ = plot_durations(labels, get_duration(df, setups))
-    figures.append(("duration", fig_duration))
-
-    fig_vars, _ = plot_vars(labels, get_remaining_vars_ratio(df, setups))
-    figures.append(("variables", fig_vars))
-
-    fig_growth, _ = plot_growth(labels, get_relative_growth(df, setups))
-    figures.append(("growth", fig_growth))
-
-    return figures
+    plots = [
+        ("duration", plot_durations, get_duration),
+        ("variables", plot_vars, get_remaining_vars_ratio),
+        ("growth", plot_growth, get_relative_growth),
+    ]
+    for name, plot, get_data in plots:
+        fig.clear()
+        plot(fig, labels, get_data(df, setups))
+        yield name, fig
@@ -1,17 +1,15 @@
+import numpy as np
 import pandas as pd
 
 global_col_name = "global"
 
 
 # interface
-def extract_setup_summary_data(metrics: dict, data: dict[str, dict[str, tuple[float, float, float]]],
-                               setup_key: str, input_key: str):
-    if input_key not in data:
-        data[input_key] = dict()
-    data[input_key][setup_key] = (
+def get_setup_summary_data(metrics: dict) -> tuple[tuple[float, float, float, float], tuple[float, float, float]]:
+    local = (
         metrics["durations"]["AlgorithmTotal"][0],
         metrics["series"]["ClauseCounts"][-1],
-        max(metrics["series"]["ClauseCounts"]),
+        np.max(metrics["series"]["ClauseCounts"]),
         metrics["counters"]["FinalVars"],
     )
     general = (
@@ -19,25 +17,30 @@ def extract_setup_summary_data(metrics: dict, data: dict[str, dict[str, tuple[fl
         metrics["counters"]["InitVars"],
         metrics["counters"]["InitVars"] - metrics["counters"]["MinVar"] + 1,
     )
-    if global_col_name not in data[input_key]:
-        data[input_key][global_col_name] = general
-    else:
-        assert data[input_key][global_col_name] == general
+    return local, general
 
 
-def create_setup_summary_table(data: dict[str, dict[str, tuple[float, float, float]]], setups: list[str]) -> pd.DataFrame:
-    inputs = sorted(data.keys())
+def create_setup_summary_table(records: list[tuple[str, str, tuple[tuple[float, float, float, float],
+                                                                   tuple[float, float, float]]]],
+                               setups: list[str]) -> pd.DataFrame:
     global_cols = ["size", "vars", "aux_vars"]
     local_cols = ["duration", "end_size", "max_size", "end_vars"]
-    complete_data = {(global_col_name, v): [] for v in global_cols}
-    complete_data |= {(s, v): [] for s in setups for v in local_cols}
-    for _, i_data in sorted(data.items()):
-        values = i_data.get(global_col_name, tuple([float("nan")] * len(global_cols)))
-        for c, v in zip(global_cols, values):
-            complete_data[(global_col_name, c)].append(v)
-        for s in setups:
-            values = i_data.get(s, tuple([float("nan")] * len(local_cols)))
-            for c, v in zip(local_cols, values):
-                complete_data[(s, c)].append(v)
-    df = pd.DataFrame(complete_data, index=inputs)
+    local_data = pd.DataFrame([(s, i, *local) for s, i, (local, _) in records], columns=["setup", "input", *local_cols])
+    general_data = pd.DataFrame([(i, *general) for _, i, (_, general) in records], columns=["input", *global_cols])
+    general_data = general_data.drop_duplicates().set_index("input")
+    # global values of an input must be the same in all setups
+    if not general_data.index.is_unique:
+        duplicated = general_data.index[general_data.index.duplicated()].unique().tolist()
+        raise ValueError(f"Inputs with different global values in different setups: {duplicated}")
+    inputs = general_data.index.sort_values()
+    # missing (setup, input) combinations are filled with NaN; only the columns of the affected setup become float
+    columns = {global_col_name: general_data.reindex(inputs)}
+    by_setup = dict(tuple(local_data.groupby("setup")))
+    for s in setups:
+        if s in by_setup:
+            columns[s] = by_setup[s].set_index("input")[local_cols].reindex(inputs)
+        else:
+            columns[s] = pd.DataFrame(float("nan"), index=inputs, columns=local_cols)
+    df = pd.concat(columns, axis=1)
+    df.index.name = None
     return df
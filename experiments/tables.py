@@ -1,5 +1,6 @@
+import warnings
+import numpy as np
 import pandas as pd
-from typing import Callable
 
 # data processing
 elimination_table_keys: list[str] = [
@@ -11,95 +12,120 @@ elimination_table_keys: list[str] = [
 ]
 
 
+def stack_series(data: list[list[int]]) -> np.ndarray:
+    # series as the rows of a 2D array; series of different lengths (e.g. when incremental absorbed clause removal
+    # is stopped before building its result) are padded with NaN at the end, as in a table built by pandas
+    length = max((len(series) for series in data), default=0)
+    if any(len(series) != length for series in data):
+        values = np.full((len(data), length), np.nan)
+        for row, series in zip(values, data):
+            row[:len(series)] = series
+        return values
+    values = np.array(data)
+    # already padded series stay float
+    return values if values.dtype.kind == "f" else values.astype(np.int64, copy=False)
+
+
+def create_table(data: list[list[int]], columns: list[str]) -> pd.DataFrame:
+    # series become the columns (padded with NaN if their lengths differ); an empty table gets a single row of -1
+    values = stack_series(data).T
+    if len(values) == 0:
+        values = np.full((1, len(columns)), -1, dtype=np.int64)
+    # the array is freshly built, the table can use it without a copy
+    return pd.DataFrame(values, columns=columns, copy=False)
+
+
 def create_elimination_table(metrics: dict) -> pd.DataFrame:
-    data = [metrics["durations"]["EliminateVar_" + key] for key in elimination_table_keys]
-    table = pd.DataFrame(data).transpose()
-    table.columns = elimination_table_keys
-    table["MeasurementOverhead"] = table["Total"] - table[elimination_table_keys[1:]].sum(axis=1)
-    if table.empty:
-        table.loc[0] = -1
-    return table
+    durations = metrics["durations"]
+    data = [durations["EliminateVar_" + key] for key in elimination_table_keys]
+    values = stack_series(data)
+    overhead = values[0] - np.nansum(values[1:], axis=0)
+    return create_table([*values, overhead], elimination_table_keys + ["MeasurementOverhead"])
 
 
 def create_variables_table(metrics: dict) -> pd.DataFrame:
-    data = metrics["durations"]["VarSelection"]
-    table = pd.DataFrame(data)
-    table.columns = ["VarSelection"]
-    if table.empty:
-        table.loc[0] = -1
-    return table
+    data = [metrics["durations"]["VarSelection"]]
+    return create_table(data, ["VarSelection"])
 
 
 def create_absorbed_table(metrics: dict) -> pd.DataFrame:
-    if len(metrics["durations"]["RemoveAbsorbedClauses_Serialize"]) == 0:
-        assert len(metrics["durations"]["RemoveAbsorbedClauses_Build"]) == 0
+    durations = metrics["durations"]
+    series = metrics["series"]
+    serialize = durations["RemoveAbsorbedClauses_Serialize"]
+    build = durations["RemoveAbsorbedClauses_Build"]
+    if len(serialize) == 0 and len(build) > 0:
+        raise ValueError(f"RemoveAbsorbedClauses has {len(build)} build durations but no serialize durations")
+    if len(serialize) == 0:
         data = [
-            metrics["durations"]["RemoveAbsorbedClauses_Search"],
-            metrics["series"]["AbsorbedClausesRemoved"],
+            durations["RemoveAbsorbedClauses_Search"],
+            series["AbsorbedClausesRemoved"],
         ]
         columns = ["Search", "AbsorbedClausesRemoved"]
     else:
         data = [
-            metrics["durations"]["RemoveAbsorbedClauses_Serialize"],
-            metrics["durations"]["RemoveAbsorbedClauses_Search"],
-            metrics["durations"]["RemoveAbsorbedClauses_Build"],
-            metrics["series"]["AbsorbedClausesRemoved"],
+            serialize,
+            durations["RemoveAbsorbedClauses_Search"],
+            build,
+            series["AbsorbedClausesRemoved"],
         ]
         columns = ["Serialize", "Search", "Build", "AbsorbedClausesRemoved"]
 
-    table = pd.DataFrame(data).transpose()
-    table.columns = columns
-    table.insert(0, "TotalDuration", table.iloc[:, :-1].sum(axis=1))
-    if table.empty:
-        table.loc[0] = -1
-    return table
+    values = stack_series(data)
+    # missing (padded) durations don't count towards the total
+    total = np.nansum(values[:-1], axis=0)
+    return create_table([total, *values], ["TotalDuration"] + columns)
 
 
 def create_incremental_absorbed_table(metrics: dict) -> pd.DataFrame:
-    if len(metrics["durations"]["IncrementalAbsorbedRemoval_Serialize"]) == 0:
-        assert len(metrics["durations"]["IncrementalAbsorbedRemoval_Build"]) == 0
+    durations = metrics["durations"]
+    series = metrics["series"]
+    serialize = durations["IncrementalAbsorbedRemoval_Serialize"]
+    build = durations["IncrementalAbsorbedRemoval_Build"]
+    if len(serialize) == 0 and len(build) > 0:
+        raise ValueError(f"IncrementalAbsorbedRemoval has {len(build)} build durations but no serialize durations")
+    if len(serialize) == 0:
         data = [
-            metrics["durations"]["IncrementalAbsorbedRemoval_Search"],
-            metrics["series"]["AbsorbedClausesNotAdded"],
+            durations["IncrementalAbsorbedRemoval_Search"],
+            series["AbsorbedClausesNotAdded"],
         ]
         columns = ["Search", "AbsorbedClausesNotAdded"]
     else:
         data = [
-            metrics["durations"]["IncrementalAbsorbedRemoval_Serialize"],
-            metrics["durations"]["IncrementalAbsorbedRemoval_Search"],
-            metrics["durations"]["IncrementalAbsorbedRemoval_Build"],
-            metrics["series"]["AbsorbedClausesNotAdded"],
+            serialize,
+            durations["IncrementalAbsorbedRemoval_Search"],
+            build,
+            series["AbsorbedClausesNotAdded"],
         ]
         columns = ["Serialize", "Search", "Build", "AbsorbedClausesNotAdded"]
 
-    table = pd.DataFrame(data).transpose()
-    table.columns = columns
-    table.insert(0, "TotalDuration", table.iloc[:, :-1].sum(axis=1))
-    if table.empty:
-        table.loc[0] = -1
-    return table
+    values = stack_series(data)
+    # missing (padded) durations don't count towards the total
+    total = np.nansum(values[:-1], axis=0)
+    return create_table([total, *values], ["TotalDuration"] + columns)
 
 
 def create_zbdd_size_table(metrics: dict) -> pd.DataFrame:
-    data = [
-        metrics["series"]["ClauseCounts"],
-        metrics["series"]["NodeCounts"],
-    ]
-    table = pd.DataFrame(data).transpose()
-    table.columns = ["ClauseCounts", "NodeCounts"]
-    return table
+    # both series get a value in each step, they are used directly as the columns
+    series = metrics["series"]
+    data = {
+        "ClauseCounts": series["ClauseCounts"],
+        "NodeCounts": series["NodeCounts"],
+    }
+    return pd.DataFrame(data)
 
 
 def get_heuristic_correlation(metrics: dict) -> float:
-    data = [
-        metrics["series"]["HeuristicScores"],
-        metrics["series"]["ClauseCountDifference"],
-    ]
-    table = pd.DataFrame(data).transpose()
-    if table.empty:
+    series = metrics["series"]
+    scores = np.array(series["HeuristicScores"], dtype=np.float64)
+    differences = np.array(series["ClauseCountDifference"], dtype=np.float64)
+    if len(scores) == 0:
         return 0
-    correlation = table[0].corr(table[1])
-    return correlation
+    if len(scores) < 2:
+        return float("nan")
+    # Pearson correlation, computed the same way as by pandas; constant series have an undefined (NaN) correlation
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = np.corrcoef(scores, differences)[0, 1]
+    return float(correlation)
 
 
 def get_unit_propagations_per_second(metrics: dict) -> float:
@@ -112,95 +138,168 @@ def get_unit_propagations_per_second(metrics: dict) -> float:
 
 
 def get_backtrack_to_propagation_ratio(metrics: dict) -> float:
-    backtrack = metrics["cumulative_durations"]["WatchedLiterals_Backtrack"]
-    propagation = metrics["cumulative_durations"]["WatchedLiterals_Propagation"]
+    cumulative_durations = metrics["cumulative_durations"]
+    backtrack = cumulative_durations["WatchedLiterals_Backtrack"]
+    propagation = cumulative_durations["WatchedLiterals_Propagation"]
     if propagation == 0:
         return -1
     return backtrack / propagation
 
 
 def create_overall_summary_table(metrics: dict, stages_summary: pd.DataFrame) -> pd.DataFrame:
+    counters = metrics["counters"]
+    series = metrics["series"]
+    durations = metrics["durations"]
+    write_duration = durations["WriteOutputFormula"]
+    # a single row of scalars, the one-element duration series are unpacked
     data = {
-        "InitVars": metrics["counters"]["InitVars"],
-        "FinalVars": metrics["counters"]["FinalVars"],
-        "EliminatedVars": metrics["counters"]["EliminatedVars"],
-        "InitClauses": metrics["series"]["ClauseCounts"][0],
-        "FinalClauses": metrics["series"]["ClauseCounts"][-1],
-        "RemovedUnitLiterals": metrics["counters"]["UnitLiteralsRemoved"],
-        "RemovedAbsorbedClauses": metrics["counters"]["AbsorbedClausesRemoved"],
+        "InitVars": counters["InitVars"],
+        "FinalVars": counters["FinalVars"],
+        "EliminatedVars": counters["EliminatedVars"],
+        "InitClauses": series["ClauseCounts"][0],
+        "FinalClauses": series["ClauseCounts"][-1],
+        "RemovedUnitLiterals": counters["UnitLiteralsRemoved"],
+        "RemovedAbsorbedClauses": counters["AbsorbedClausesRemoved"],
         "HeuristicCorrelation": get_heuristic_correlation(metrics),
-        "ReadDuration": metrics["durations"]["ReadInputFormula"],
-        "WriteDuration": metrics["durations"]["WriteOutputFormula"] or 0,
-        "AlgorithmDuration": metrics["durations"]["AlgorithmTotal"],
+        "ReadDuration": durations["ReadInputFormula"][0],
+        "WriteDuration": write_duration[0] if len(write_duration) > 0 else 0,
+        "AlgorithmDuration": durations["AlgorithmTotal"][0],
         "VarSelection": stages_summary["VarSelection"].loc["sum"],
         "Elimination": stages_summary["Elimination"].loc["sum"],
         "AbsorbedRemoval": stages_summary["AbsorbedRemovalDuration"].loc["sum"],
         "UnitPropagationsPerSecond": get_unit_propagations_per_second(metrics),
         "BacktrackToPropagationRatio": get_backtrack_to_propagation_ratio(metrics),
     }
-    table = pd.DataFrame(data)
+    table = pd.DataFrame([data])
     return table
 
 
-def get_part_of_total_func(total_sum: int, multiplier: float) -> Callable[[pd.Series], float]:
-    def ret_0(df_col: pd.Series) -> float:
-        assert df_col.sum() == 0
-        return 0
-    def part_of_total(df_col: pd.Series) -> float:
-        return (df_col.sum() / total_sum) * multiplier
-    if total_sum == 0:
-        return ret_0
+def describe_columns(values: np.ndarray, sums: np.ndarray = None) -> dict[str, np.ndarray]:
+    # statistics of each column of a 2D array (a column-major copy makes the reductions run over contiguous
+    # memory, in the same order as on a single pandas column); column sums already computed by the caller are
+    # reused for the mean
+    values = np.asfortranarray(values)
+    if values.dtype.kind == "f":
+        return describe_padded_columns(values, sums)
+    count = len(values)
+    if sums is None:
+        sums = values.sum(axis=0)
+    mean = sums / count
+    if count < 2:
+        std = np.zeros(values.shape[1])
     else:
-        return part_of_total
+        std = values.std(axis=0, ddof=1)
+    nonzero_mean = np.where(mean == 0, 1, mean)
+    rel_std = np.where(mean == 0, std, std / nonzero_mean * 100)
+    return {
+        "mean": mean,
+        "median": np.median(values, axis=0),
+        "std": std,
+        "rel_std": rel_std,
+        "max": values.max(axis=0),
+        "argmax": values.argmax(axis=0),
+    }
 
 
-def std(df_col: pd.Series) -> float:
-    if len(df_col) < 2:
-        return 0
+def describe_padded_columns(values: np.ndarray, sums: np.ndarray = None) -> dict[str, np.ndarray]:
+    # the same statistics of columns padded with NaN, computed only from their actual values (as pandas does);
+    # columns without any values get -1 like empty tables
+    padding = np.isnan(values)
+    count = len(values) - padding.sum(axis=0)
+    if sums is None:
+        sums = np.nansum(values, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        # all-NaN columns and columns with a single value make the NaN-skipping reductions warn
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = sums / count
+        median = np.nanmedian(values, axis=0)
+        if len(values) < 2:
+            std = np.zeros(values.shape[1])
+        else:
+            std = np.where(count < 2, 0, np.nanstd(values, axis=0, ddof=1))
+    nonzero_mean = np.where(mean == 0, 1, mean)
+    rel_std = np.where(mean == 0, std, std / nonzero_mean * 100)
+    filled = np.where(padding, -np.inf, values)
+    summary = {
+        "mean": mean,
+        "median": median,
+        "std": std,
+        "rel_std": rel_std,
+        "max": filled.max(axis=0),
+        "argmax": filled.argmax(axis=0),
+    }
+    empty = count == 0
+    for statistic in summary.values():
+        statistic[empty] = -1
+    return summary
+
+
+def summarize_columns(values: np.ndarray, total_sum: int) -> dict[str, np.ndarray]:
+    values = np.asfortranarray(values)
+    if values.dtype.kind == "f":
+        # columns padded with NaN
+        sums = np.nansum(values, axis=0)
+        count = len(values) - np.isnan(values).sum(axis=0)
+    else:
+        sums = values.sum(axis=0)
+        count = np.full(len(sums), len(values))
+    if total_sum == 0:
+        if (sums != 0).any():
+            raise ValueError("Columns have a nonzero sum but the total is zero")
+        part_of_total = np.zeros(len(sums))
     else:
-        return df_col.std()
+        part_of_total = (sums / total_sum) * 100_000
+    summary = {
+        "count": count,
+        "sum": sums,
+        "part_of_total": part_of_total,
+        **describe_columns(values, sums),
+    }
+    return summary
 
 
-def rel_std(df_col: pd.Series) -> float:
-    mean = df_col.mean()
-    if mean == 0:
-        return std(df_col)
-    else:
-        return (std(df_col) / mean) * 100
+def summary_to_int(summary: dict[str, np.ndarray]) -> np.ndarray:
+    # summaries are presented as integers; floating point statistics are truncated, integer ones (count, sum, max,
+    # argmax) are taken as they are without a round trip through floats
+    return np.array(list(summary.values()), dtype=np.int64)
+
 
+def summarize_tables(tables: list[pd.DataFrame], total_sum: int) -> list[pd.DataFrame]:
+    # tables with the same number of rows (and without or with padding) are summarized together in a single pass
+    # over their stacked columns, the summary is then split back into the individual tables
+    by_shape: dict[tuple[int, np.dtype], list[int]] = dict()
+    for i, table in enumerate(tables):
+        by_shape.setdefault((len(table), table.to_numpy().dtype), []).append(i)
+    summaries: list[pd.DataFrame] = [None] * len(tables)
+    for indices in by_shape.values():
+        summary = summarize_columns(np.hstack([tables[i].to_numpy() for i in indices]), total_sum)
+        values = summary_to_int(summary)
+        start = 0
+        for i in indices:
+            end = start + len(tables[i].columns)
+            summaries[i] = pd.DataFrame(values[:, start:end], index=list(summary.keys()), columns=tables[i].columns)
+            start = end
+    return summaries
 
-def get_aggregation_functions(total_sum: int) -> list:
-    return [
-        "count",
-        "sum",
-        get_part_of_total_func(total_sum, 100_000),
-        "mean",
-        "median",
-        std,
-        rel_std,
-        "max",
-        "argmax",
-    ]
+
+def describe_table(table: pd.DataFrame) -> pd.DataFrame:
+    summary = describe_columns(table.to_numpy())
+    return pd.DataFrame(summary_to_int(summary), index=list(summary.keys()), columns=table.columns)
 
 
 def create_tables(metrics: dict) -> list[tuple[str, pd.DataFrame, bool]]:
     tables = []
 
     elimination = create_elimination_table(metrics)
-
-    total_sum = elimination["Total"].sum()
-    aggregation_functions = get_aggregation_functions(total_sum)
-
-    elimination_summary = elimination.aggregate(aggregation_functions).astype(int, copy=False)
-    tables.append(("elimination_stages", elimination_summary.drop("count"), True))
-
     variables = create_variables_table(metrics)
-    variables_summary = variables.aggregate(aggregation_functions).astype(int, copy=False)
-
     absorbed = create_absorbed_table(metrics)
-    absorbed_summary = absorbed.aggregate(aggregation_functions).astype(int, copy=False)
     incremental_absorbed = create_incremental_absorbed_table(metrics)
-    incremental_summary = incremental_absorbed.aggregate(aggregation_functions).astype(int, copy=False)
+
+    total_sum = int(np.nansum(elimination["Total"].to_numpy()))
+    summaries = summarize_tables([elimination, variables, absorbed, incremental_absorbed], total_sum)
+    elimination_summary, variables_summary, absorbed_summary, incremental_summary = summaries
+    tables.append(("elimination_stages", elimination_summary.drop("count"), True))
+
     absorbed_and_incremental_absorbed_summary = absorbed_summary.add_prefix("Removed_").join(incremental_summary.add_prefix("Incremental_"))
     tables.append(("absorbed_clauses", absorbed_and_incremental_absorbed_summary, True))
 
@@ -213,7 +312,7 @@ def create_tables(metrics: dict) -> list[tuple[str, pd.DataFrame, bool]]:
     tables.append(("algorithm_stages", stages_summary, True))
 
     sizes = create_zbdd_size_table(metrics)
-    sizes_summary = sizes.aggregate(aggregation_functions[3:]).astype(int, copy=False)
+    sizes_summary = describe_table(sizes)
     tables.append(("zbdd_sizes", sizes_summary, True))
 
     overall_summary = create_overall_summary_table(metrics, stages_summary)